@@ -1,18 +1,29 @@
 """
 AI Assistant implementation with fallback responses for code generation and programming help
 """
+import asyncio
 import logging
 import os
-from typing import List, Dict, Any
-from openai import OpenAI
+import time
+from typing import List, Dict, Any, Optional
+from openai import AsyncOpenAI
 from fallback_responses import BabatundeFallbackResponses
+from config import Config
+from usage_tracker import UsageTracker
+from request_context import RequestContext, RequestCancelled, STAGE_UPSTREAM
+from model_router import ModelTier, RequestClassifier, TierStats, TIER_FAST, TIER_FULL
 
 logger = logging.getLogger(__name__)
 
+# Number of most recent history messages sent with each request
+HISTORY_MESSAGES = 10
+
 class AIAssistant:
     """AI Assistant for programming help and code generation using OpenRouter"""
     
-    def __init__(self):
+    def __init__(self, config: Config, usage_tracker: Optional[UsageTracker] = None):
+        self.config = config
+        self.usage_tracker = usage_tracker
         self.openai_api_key = os.getenv("OPENAI_API_KEY")
         
         # Try to configure OpenAI client but prepare fallback
@@ -21,14 +32,17 @@ class AIAssistant:
         
         if self.openai_api_key:
             try:
-                self.client = OpenAI(api_key=self.openai_api_key)
-                self.model = "gpt-4o"
+                self.client = AsyncOpenAI(api_key=self.openai_api_key)
                 self.use_fallback = False
                 logger.info("OpenAI client configured successfully")
             except Exception as e:
                 logger.warning(f"Failed to configure OpenAI client: {e}")
                 self.use_fallback = True
         
+        # Route small talk to the fast model tier
+        self.classifier = RequestClassifier()
+        self.tier_stats = TierStats()
+        
         # Initialize fallback response system
         self.fallback_system = BabatundeFallbackResponses()
         logger.info("Fallback response system initialized")
@@ -60,45 +74,86 @@ When someone asks about programming or math, be confused and redirect to simple
 Example: "Eh bratha, wetin be this Python you dey talk? Me know say python na snake for bush! You want make me catch snake? Me too old for that wahala!"
 """
     
-    async def get_response(self, user_message: str, conversation_history: List[Dict[str, Any]] = None) -> str:
+    async def get_response(self, user_message: str, conversation_history: List[Dict[str, Any]] = None,
+                           user_id: Optional[int] = None, request: Optional[RequestContext] = None,
+                           tier: Optional[str] = None, memories: Optional[List[str]] = None,
+                           history_messages: int = HISTORY_MESSAGES) -> str:
         """
         Get AI response for programming assistance
         
         Args:
             user_message: Current user message
             conversation_history: Previous conversation context
+            user_id: User the request is made for, used for usage accounting
+            request: Deadline and cancellation token of the request
+            tier: Model tier to use instead of classifying the request
+            memories: Relevant turns from older conversations to include in the prompt
+            history_messages: Number of most recent history messages sent with the request
             
         Returns:
             AI assistant response
+            
+        Raises:
+            RequestCancelled: If the request was cancelled or ran past its deadline
         """
         # Try OpenAI API first if available
         if not self.use_fallback and self.client:
             try:
+                # Read settings once so the whole request uses one consistent snapshot
+                settings = self.config.settings
+                
+                tier = self._select_tier(user_message, conversation_history, settings, tier)
+                
                 # Prepare messages for OpenAI API
                 messages = [{"role": "system", "content": self.system_prompt}]
                 
+                # Add relevant older turns retrieved from long-term memory
+                if memories:
+                    messages.append({
+                        "role": "system",
+                        "content": "Things this person told you before that may be relevant:\n\n" + "\n\n".join(memories)
+                    })
+                
                 # Add conversation history if provided
                 if conversation_history:
                     # Take only recent messages to stay within token limits
-                    recent_history = conversation_history[-10:]  # Last 10 messages
+                    recent_history = conversation_history[-history_messages:]
                     messages.extend(recent_history)
                 
                 # Add current user message
                 messages.append({"role": "user", "content": user_message})
                 
-                # Call OpenAI API
-                response = self.client.chat.completions.create(
-                    model=self.model,
+                # Call OpenAI API, bounded by the request deadline so an abandoned
+                # call is aborted upstream instead of running to completion
+                if request:
+                    request.check()
+                    request.stage = STAGE_UPSTREAM
+                started = time.monotonic()
+                completion = self.client.chat.completions.create(
+                    model=tier.model,
                     messages=messages,
-                    max_tokens=2000,
-                    temperature=0.7,
+                    max_tokens=tier.max_tokens,
+                    temperature=settings.openai_temperature,
                     top_p=1,
                     frequency_penalty=0,
                     presence_penalty=0
                 )
+                try:
+                    response = await asyncio.wait_for(completion, request.remaining() if request else None)
+                except asyncio.TimeoutError:
+                    raise RequestCancelled("deadline")
+                
+                # Record latency and token usage reported by the API
+                prompt_tokens = response.usage.prompt_tokens if response.usage else 0
+                completion_tokens = response.usage.completion_tokens if response.usage else 0
+                self.tier_stats.record(tier.name, time.monotonic() - started, prompt_tokens, completion_tokens)
+                if self.usage_tracker and user_id is not None and response.usage:
+                    self.usage_tracker.record(user_id, tier.model, prompt_tokens, completion_tokens)
                 
                 return response.choices[0].message.content
                 
+            except RequestCancelled:
+                raise
             except Exception as e:
                 logger.warning(f"OpenAI API failed, using fallback: {e}")
                 # Fall through to use fallback system
@@ -107,7 +162,15 @@ Example: "Eh bratha, wetin be this Python you dey talk? Me know say python na sn
         logger.info("Using fallback response system")
         return self.fallback_system.get_response(user_message)
     
-    def is_healthy(self) -> bool:
+    def _select_tier(self, user_message: str, conversation_history: Optional[List[Dict[str, Any]]],
+                     settings, tier: Optional[str] = None) -> ModelTier:
+        """Pick the model and token budget for a request"""
+        tier = tier or self.classifier.classify(user_message, conversation_history)
+        if tier == TIER_FAST:
+            return ModelTier(TIER_FAST, settings.openai_fast_model, settings.openai_fast_max_tokens)
+        return ModelTier(TIER_FULL, settings.openai_model, settings.openai_max_tokens)
+    
+    async def is_healthy(self) -> bool:
         """Check if the AI assistant is healthy and can respond"""
         if self.use_fallback:
             # Fallback system is always healthy
@@ -115,8 +178,8 @@ Example: "Eh bratha, wetin be this Python you dey talk? Me know say python na sn
         elif self.client:
             try:
                 # Simple test to verify API key works
-                test_response = self.client.chat.completions.create(
-                    model=self.model,
+                test_response = await self.client.chat.completions.create(
+                    model=self.config.settings.openai_model,
                     messages=[{"role": "user", "content": "Test"}],
                     max_tokens=5
                 )
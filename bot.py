@@ -4,22 +4,32 @@ Telegram Bot implementation with AI conversation capabilities
 import logging
 import os
 import asyncio
-from typing import Dict, Any
+import random
+from typing import Dict, Any, Optional
 from datetime import datetime, timedelta
 
-from telegram import Update, BotCommand
+from telegram import Update, BotCommand, InlineQueryResultArticle, InputTextMessageContent
 from telegram.ext import (
     Application, 
     CommandHandler, 
     MessageHandler, 
+    InlineQueryHandler,
     filters, 
     ContextTypes
 )
 from telegram.constants import ParseMode
 
-from ai_assistant import AIAssistant
+from ai_assistant import AIAssistant, HISTORY_MESSAGES
 from rate_limiter import RateLimiter
 from config import Config
+from usage_tracker import UsageTracker
+from profiler import Profiler
+from group_chat import GroupChatFilter, GroupContextStore, is_group_chat
+from debouncer import MessageDebouncer
+from request_context import RequestContext, RequestRegistry, RequestCancelled, STAGE_SENDING
+from inline_cache import InlineAnswerCache, SEED_PROMPTS, result_id
+from model_router import TIER_FAST
+from long_term_memory import LongTermMemory
 
 logger = logging.getLogger(__name__)
 
@@ -28,27 +38,80 @@ class TelegramAIBot:
     
     def __init__(self):
         self.config = Config()
-        self.ai_assistant = AIAssistant()
+        self.usage_tracker = UsageTracker(self.config)
+        self.ai_assistant = AIAssistant(self.config, self.usage_tracker)
         self.rate_limiter = RateLimiter()
+        self.profiler = Profiler(self.config.profile_output_dir)
         
         # Store conversation contexts per user
         self.user_contexts: Dict[int, list] = {}
         
+        # Older turns are indexed per user and retrieved only when relevant;
+        # the exchanges still sent as history (HISTORY_MESSAGES messages) are not searched
+        self.long_term_memory = LongTermMemory(
+            max_turns=self.config.memory_max_turns,
+            max_users=self.config.memory_max_users,
+            max_total_turns=self.config.memory_max_total_turns,
+            top_k=self.config.memory_top_k,
+            min_similarity=self.config.memory_min_similarity,
+            exclude_recent=HISTORY_MESSAGES // 2
+        )
+        
+        # Merge rapid message bursts into a single completion
+        self.debouncer = MessageDebouncer()
+        
+        # Active request per conversation, so abandoned completions can be cancelled
+        self.requests = RequestRegistry()
+        
+        # Inline queries are answered from a cache of popular prompts, seeded from the phrase bank
+        self.inline_cache = InlineAnswerCache(answer_ttl=self.config.inline_answer_ttl)
+        for prompt in SEED_PROMPTS:
+            self.inline_cache.seed(prompt, self.ai_assistant.fallback_system.get_response(prompt))
+        
+        # Group chats share one context per group and only get answers when addressed
+        self.group_filter = GroupChatFilter(self.config.group_trigger_pattern)
+        self.group_contexts = GroupContextStore(
+            max_messages=self.config.group_context_size,
+            max_groups=self.config.group_max_chats
+        )
+        
         # Initialize bot application
-        self.application = Application.builder().token(self.config.telegram_token).build()
+        self.application = (
+            Application.builder()
+            .token(self.config.telegram_token)
+            .concurrent_updates(True)
+            .post_init(self._post_init)
+            .build()
+        )
         self._setup_handlers()
     
     def _setup_handlers(self):
         """Setup command and message handlers"""
-        # Command handlers
-        self.application.add_handler(CommandHandler("start", self.start_command))
-        self.application.add_handler(CommandHandler("help", self.help_command))
-        self.application.add_handler(CommandHandler("clear", self.clear_command))
-        self.application.add_handler(CommandHandler("status", self.status_command))
+        # Command handlers (wrapped for per-handler wall/CPU time counters)
+        commands = {
+            "start": self.start_command,
+            "help": self.help_command,
+            "clear": self.clear_command,
+            "status": self.status_command,
+            "config": self.config_command,
+            "usage": self.usage_command,
+            "tiers": self.tiers_command,
+            "profile": self.profile_command,
+        }
+        for name, callback in commands.items():
+            self.application.add_handler(CommandHandler(name, self.profiler.track(name, callback)))
         
         # Message handler for regular conversation
         self.application.add_handler(
-            MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_message)
+            MessageHandler(
+                filters.TEXT & ~filters.COMMAND,
+                self.profiler.track("message", self.handle_message)
+            )
+        )
+        
+        # Inline query handler
+        self.application.add_handler(
+            InlineQueryHandler(self.profiler.track("inline", self.inline_query))
         )
         
         # Error handler
@@ -89,9 +152,23 @@ class TelegramAIBot:
         """Handle /clear command"""
         user_id = update.effective_user.id
         
-        # Clear user's conversation context
-        if user_id in self.user_contexts:
-            del self.user_contexts[user_id]
+        # The group context is shared, so only group admins may reset it
+        if is_group_chat(update.effective_chat.type) and not self.config.is_admin(user_id):
+            member = await context.bot.get_chat_member(update.effective_chat.id, user_id)
+            if member.status not in ("administrator", "creator"):
+                await update.message.reply_text("Bratha, only the group chiefs fit make me forget this group talk.")
+                return
+        
+        # Abandon pending and in-flight completions so their results never reach the new history
+        self.debouncer.discard_chat(update.effective_chat.id)
+        self.requests.cancel_chat(update.effective_chat.id, "cleared")
+        
+        # Clear the group's shared context, or the user's own context
+        if is_group_chat(update.effective_chat.type):
+            self.group_contexts.clear(update.effective_chat.id)
+        else:
+            self.user_contexts.pop(user_id, None)
+            self.long_term_memory.clear(user_id)
         
         await update.message.reply_text(
             "Ah bratha! Me don forget everything now. We start fresh like new day!",
@@ -114,12 +191,168 @@ class TelegramAIBot:
         
         await update.message.reply_text(status_message, parse_mode=ParseMode.MARKDOWN)
     
+    async def _require_admin(self, update: Update) -> bool:
+        """Check that the sender is an admin, replying with a refusal if not"""
+        if self.config.is_admin(update.effective_user.id):
+            return True
+        
+        await update.message.reply_text("Bratha, dis one na only for the big men. Me no fit do am for you.")
+        return False
+    
+    async def config_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /config command (admin only): show or change runtime settings"""
+        if not await self._require_admin(update):
+            return
+        
+        user_id = update.effective_user.id
+        args = context.args or []
+        try:
+            if not args:
+                settings = self.config.settings
+            elif args[0] == "reload":
+                if not self.config.reload_from_file():
+                    await update.message.reply_text("No runtime config file loaded. Check the logs.")
+                    return
+                settings = self.config.settings
+            elif len(args) == 2:
+                settings = self.config.update_settings(**{args[0]: args[1]})
+                logger.info(f"Admin {user_id} changed setting {args[0]} to {args[1]}")
+            else:
+                await update.message.reply_text(
+                    "Usage:\n/config - show settings\n/config <name> <value> - change a setting\n"
+                    "/config reload - reload the runtime config file"
+                )
+                return
+        except ValueError as e:
+            await update.message.reply_text(f"Invalid setting: {e}")
+            return
+        
+        lines = [f"{name} = {value}" for name, value in settings.to_dict().items()]
+        await update.message.reply_text("Runtime settings:\n" + "\n".join(lines))
+    
+    async def usage_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /usage command (admin only): show today's top token consumers and saved work"""
+        if not await self._require_admin(update):
+            return
+        
+        top_consumers = self.usage_tracker.top_consumers(limit=10)
+        if top_consumers:
+            quota = self.config.settings.daily_token_quota
+            lines = [f"Top consumers today (quota: {quota or 'unlimited'} tokens):"]
+            for rank, (consumer_id, total, per_model) in enumerate(top_consumers, start=1):
+                models = ", ".join(f"{model}: {tokens}" for model, tokens in per_model.items())
+                lines.append(f"{rank}. {consumer_id} - {total} tokens ({models})")
+        else:
+            lines = ["No token usage recorded today."]
+        
+        lines.append("")
+        lines.append("Work saved by cancellation:")
+        lines.extend(f"{name}: {count}" for name, count in self.requests.stats().items())
+        lines.append(f"messages_merged: {self.debouncer.messages_merged}")
+        
+        lines.append("")
+        lines.append("Inline answer cache:")
+        lines.append(f"hits: {self.inline_cache.hits}")
+        lines.append(f"misses: {self.inline_cache.misses}")
+        
+        await update.message.reply_text("\n".join(lines))
+    
+    async def tiers_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /tiers command (admin only): show per-tier latency and token stats"""
+        if not await self._require_admin(update):
+            return
+        
+        summary = self.ai_assistant.tier_stats.summary()
+        if not summary:
+            await update.message.reply_text("No completions served yet.")
+            return
+        
+        lines = ["Model tier stats:"]
+        for tier, stats in summary.items():
+            lines.append(
+                f"{tier}: {stats['requests']} requests, "
+                f"avg latency {stats['avg_latency']:.2f}s (max {stats['max_latency']:.2f}s), "
+                f"avg {stats['avg_tokens']:.0f} tokens, {stats['total_tokens']} tokens total"
+            )
+        
+        await update.message.reply_text("\n".join(lines))
+    
+    async def profile_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /profile command (admin only): handler stats, profiling sessions and loop watchdog"""
+        if not await self._require_admin(update):
+            return
+        
+        args = context.args or []
+        
+        if not args or args[0] == "stats":
+            if not self.profiler.handler_stats:
+                await update.message.reply_text("No handler calls recorded yet.")
+                return
+            lines = ["Handler stats (calls, avg wall, max wall, avg CPU):"]
+            for name, stats in sorted(self.profiler.handler_stats.items(), key=lambda item: -item[1]["wall"]):
+                calls = stats["calls"]
+                lines.append(
+                    f"{name}: {calls}, {stats['wall'] / calls * 1000:.1f}ms, "
+                    f"{stats['wall_max'] * 1000:.1f}ms, {stats['cpu'] / calls * 1000:.1f}ms"
+                )
+            lines.append(f"Event loop stalls detected: {self.profiler.stalls_detected}")
+            await update.message.reply_text("\n".join(lines))
+        
+        elif args[0] == "watchdog" and len(args) == 2 and args[1] in ("on", "off"):
+            if args[1] == "on":
+                threshold = self.config.slow_callback_threshold or 0.5
+                self.profiler.start_watchdog(asyncio.get_running_loop(), threshold)
+                await update.message.reply_text(f"Event loop watchdog on (threshold {threshold}s).")
+            else:
+                self.profiler.stop_watchdog()
+                await update.message.reply_text("Event loop watchdog off.")
+        
+        elif args[0].isdigit() and 0 < int(args[0]) <= 600:
+            try:
+                path = self.profiler.start_session(int(args[0]))
+            except RuntimeError as e:
+                await update.message.reply_text(str(e))
+                return
+            await update.message.reply_text(f"Profiling for {args[0]}s, output: {path}")
+        
+        else:
+            await update.message.reply_text(
+                "Usage:\n/profile - show handler stats\n/profile <seconds> - run sampling profiler (max 600)\n"
+                "/profile watchdog on|off - toggle event loop stall detection"
+            )
+    
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle regular text messages"""
         user_id = update.effective_user.id
         user_message = update.message.text
+        chat_id = update.effective_chat.id
+        is_group = is_group_chat(update.effective_chat.type)
+        speaker = update.effective_user.first_name or "User"
+        
+        # Bursts are debounced per chat, or per member in groups
+        debounce_key = (chat_id, user_id) if is_group else chat_id
+        request: Optional[RequestContext] = None
         
         try:
+            if is_group:
+                reply_to = update.message.reply_to_message
+                is_reply_to_bot = bool(
+                    reply_to and reply_to.from_user and reply_to.from_user.id == context.bot.id
+                )
+                if not self.group_filter.should_respond(user_message, context.bot.username, is_reply_to_bot):
+                    # Unaddressed chatter only goes into the shared context, no model call
+                    self.group_contexts.add_user_message(chat_id, speaker, user_message)
+                    return
+            
+            # Wait for the burst to end; only the last message's handler continues
+            user_message = await self.debouncer.submit(
+                debounce_key, user_message, self.config.settings.debounce_seconds
+            )
+            if user_message is None:
+                return
+            
+            request = self.requests.start(debounce_key, self.config.settings.request_deadline_seconds)
+            
             # Check rate limiting
             if not self.rate_limiter.is_allowed(user_id):
                 await update.message.reply_text(
@@ -129,42 +362,93 @@ class TelegramAIBot:
                 )
                 return
             
+            # Check daily token quota before paying for a completion
+            if not self.usage_tracker.check_quota(user_id):
+                await update.message.reply_text(
+                    "Ah bratha, you don talk plenty today! Your quota for today don finish. "
+                    "Come back tomorrow make we continue."
+                )
+                return
+            
             # Send typing indicator
             await context.bot.send_chat_action(
                 chat_id=update.effective_chat.id, 
                 action="typing"
             )
             
-            # Get or initialize user conversation context
-            if user_id not in self.user_contexts:
-                self.user_contexts[user_id] = []
-            
-            # Add user message to context
-            self.user_contexts[user_id].append({
-                "role": "user",
-                "content": user_message
-            })
-            
-            # Keep context manageable (last 10 exchanges)
-            if len(self.user_contexts[user_id]) > 20:
-                self.user_contexts[user_id] = self.user_contexts[user_id][-20:]
+            # The turn is added to the context only once it has been answered, so a
+            # superseded completion leaves no trace in the history
+            if is_group:
+                # The whole group context is sent, but depth is judged by the bot's own exchanges only
+                prompt = f"{speaker}: {user_message}"
+                history = self.group_contexts.get_history(chat_id)
+                history_messages = self.config.group_context_size
+                tier = self.ai_assistant.classifier.classify(
+                    user_message, self.group_contexts.get_exchanges(chat_id)
+                )
+                memories = None
+            else:
+                prompt = user_message
+                history = self.user_contexts.get(user_id, [])
+                history_messages = HISTORY_MESSAGES
+                tier = None
+                memories = self.long_term_memory.search(user_id, user_message)
             
             # Get AI response
             ai_response = await self.ai_assistant.get_response(
-                user_message, 
-                self.user_contexts[user_id]
+                prompt, 
+                history,
+                user_id=user_id,
+                request=request,
+                tier=tier,
+                memories=memories,
+                history_messages=history_messages
             )
+            self.debouncer.complete(debounce_key)
+            
+            # Discard the result if the request was cleared or superseded meanwhile
+            request.check_cancelled()
             
-            # Add AI response to context
-            self.user_contexts[user_id].append({
-                "role": "assistant",
-                "content": ai_response
-            })
+            # Add the turn and AI response to context
+            if is_group:
+                self.group_contexts.add_user_message(chat_id, speaker, user_message)
+                self.group_contexts.add_assistant_message(chat_id, ai_response)
+            else:
+                self.long_term_memory.add_turn(user_id, user_message, ai_response)
+                user_context = self.user_contexts.setdefault(user_id, [])
+                user_context.append({
+                    "role": "user",
+                    "content": user_message
+                })
+                user_context.append({
+                    "role": "assistant",
+                    "content": ai_response
+                })
+                
+                # Keep context manageable (last 10 exchanges)
+                if len(user_context) > 20:
+                    self.user_contexts[user_id] = user_context[-20:]
+                
+                # Private prompts sent by enough distinct users warm the inline answer cache
+                self.inline_cache.record_prompt(user_message, user_id)
             
             # Send response with proper formatting
-            await self._send_formatted_response(update, ai_response)
+            request.stage = STAGE_SENDING
+            await self._send_formatted_response(update, ai_response, request)
             
             logger.info(f"Processed message from user {user_id}")
+        
+        except (asyncio.CancelledError, RequestCancelled) as e:
+            # Superseded by a newer message, cleared, or past the deadline
+            reason = getattr(e, "reason", None) or (request and request.cancelled_reason) or "superseded"
+            if request:
+                self.requests.finish(request, reason)
+                request = None
+            logger.info(f"Dropped completion for user {user_id}: {reason}")
+            
+            # Superseded and cleared requests drop silently; a timed out one still gets a reply
+            if reason == "deadline":
+                await self._send_fallback_reply(update)
             
         except Exception as e:
             logger.error(f"Error handling message from user {user_id}: {e}")
@@ -176,18 +460,78 @@ class TelegramAIBot:
                     "Try again later, no? Sometimes these tech tings just need small time to work again."
                 )
             else:
-                # Use fallback Babatunde responses like the original code
-                import random
-                fallback_responses = [
-                    "Hey bratha! Brain no dey work good now. Try later, no worries.",
-                    "Ah bratha, me get small wahala here. Come back soon!",
-                    "You know, me no too sabi tech tings. Try again later, bratha.",
-                    "Sorry bratha, something go wrong. Give me small time, I go fix am."
-                ]
-                fallback = random.choice(fallback_responses)
-                await update.message.reply_text(fallback)
+                await self._send_fallback_reply(update)
+        
+        finally:
+            self.debouncer.complete(debounce_key)
+            if request:
+                self.requests.finish(request)
+    
+    async def _send_fallback_reply(self, update: Update):
+        """Send one of the fallback Babatunde replies used when no answer is available"""
+        fallback_responses = [
+            "Hey bratha! Brain no dey work good now. Try later, no worries.",
+            "Ah bratha, me get small wahala here. Come back soon!",
+            "You know, me no too sabi tech tings. Try again later, bratha.",
+            "Sorry bratha, something go wrong. Give me small time, I go fix am."
+        ]
+        await update.message.reply_text(random.choice(fallback_responses))
+    
+    async def inline_query(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle inline queries from the precomputed answer cache"""
+        inline_query = update.inline_query
+        user_id = inline_query.from_user.id
+        query = inline_query.query.strip()
+        
+        answers = self.inline_cache.lookup(query, limit=10)
+        
+        # Fall back to a fast-tier completion only when it fits the tight inline deadline.
+        # Each keystroke sends a new query, which supersedes the user's previous one.
+        if not answers and query and self.usage_tracker.check_quota(user_id):
+            request = self.requests.start(("inline", user_id), self.config.inline_live_deadline)
+            try:
+                answer = await self.ai_assistant.get_response(
+                    query, user_id=user_id, request=request, tier=TIER_FAST
+                )
+                answers = [(query, answer)]
+            except (asyncio.CancelledError, RequestCancelled) as e:
+                reason = getattr(e, "reason", None) or request.cancelled_reason or "superseded"
+                self.requests.finish(request, reason)
+                # A superseded query is answered by the newer one; a timed out one still gets an answer
+                if reason != "deadline":
+                    return
+            else:
+                self.requests.finish(request)
+        
+        results = [
+            InlineQueryResultArticle(
+                id=result_id(prompt),
+                title=prompt.capitalize(),
+                description=answer[:100],
+                input_message_content=InputTextMessageContent(answer[:4096])
+            )
+            for prompt, answer in answers
+        ]
+        
+        # Let Telegram cache answers; empty results only briefly so a warmed cache shows up soon
+        cache_time = self.config.inline_cache_time if results else 10
+        await inline_query.answer(results, cache_time=cache_time)
+    
+    async def _refresh_inline_cache(self):
+        """Periodically regenerate missing or stale answers for popular prompts"""
+        async def generate(prompt: str) -> str:
+            request = RequestContext(("inline-refresh", prompt), self.config.settings.request_deadline_seconds)
+            return await self.ai_assistant.get_response(prompt, request=request, tier=TIER_FAST)
+        
+        while True:
+            try:
+                await self.inline_cache.refresh(generate)
+            except Exception as e:
+                logger.error(f"Error refreshing inline answer cache: {e}")
+            await asyncio.sleep(self.config.inline_refresh_interval)
     
-    async def _send_formatted_response(self, update: Update, response: str):
+    async def _send_formatted_response(self, update: Update, response: str,
+                                       request: Optional[RequestContext] = None):
         """Send response with proper formatting for code blocks"""
         try:
             # Split long messages to avoid Telegram's limit
@@ -219,8 +563,10 @@ class TelegramAIBot:
                 if current_chunk:
                     chunks.append(current_chunk.strip())
                 
-                # Send chunks
+                # Send chunks, stopping if the request is cancelled midway
                 for i, chunk in enumerate(chunks):
+                    if request:
+                        request.check_cancelled()
                     if i == 0:
                         await update.message.reply_text(
                             chunk + f"\n\n*[Message {i+1}/{len(chunks)}]*",
@@ -232,6 +578,8 @@ class TelegramAIBot:
                             parse_mode=ParseMode.MARKDOWN
                         )
                         
+        except RequestCancelled:
+            raise
         except Exception as e:
             logger.error(f"Error sending formatted response: {e}")
             # Fallback to plain text
@@ -252,6 +600,12 @@ class TelegramAIBot:
     def run(self):
         """Run the bot"""
         try:
+            # Pick up runtime config changes from file and SIGHUP
+            self.config.start_watching()
+            
+            # Start a profiling session on SIGUSR1
+            self.profiler.install_signal_handler(self.config.profile_signal_duration)
+            
             # Set up bot commands
             asyncio.get_event_loop().run_until_complete(
                 self._setup_bot_commands()
@@ -274,6 +628,13 @@ class TelegramAIBot:
             logger.error(f"Failed to run bot: {e}")
             raise
     
+    async def _post_init(self, application: Application):
+        """Start background monitoring once the event loop is running"""
+        if self.config.slow_callback_threshold > 0:
+            self.profiler.start_watchdog(asyncio.get_running_loop(), self.config.slow_callback_threshold)
+        
+        application.create_task(self._refresh_inline_cache())
+    
     async def _setup_bot_commands(self):
         """Setup bot commands for Telegram UI"""
         commands = [
@@ -2,11 +2,80 @@
 Configuration management for the Telegram AI Bot
 """
 import os
-from typing import Optional
+import json
+import signal
+import threading
+from typing import Optional, Dict, Any
 import logging
 
 logger = logging.getLogger(__name__)
 
+
+class RuntimeSettings:
+    """Immutable snapshot of the settings that can be tuned while the bot is running"""
+    
+    # Setting name -> type used to coerce values coming from files or commands
+    FIELDS = {
+        "openai_model": str,
+        "openai_max_tokens": int,
+        "openai_temperature": float,
+        "openai_fast_model": str,
+        "openai_fast_max_tokens": int,
+        "daily_token_quota": int,
+        "debounce_seconds": float,
+        "request_deadline_seconds": float,
+        "log_level": str,
+    }
+    
+    LOG_LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL")
+    
+    __slots__ = tuple(FIELDS)
+    
+    def __init__(self, **values):
+        for name, cast in self.FIELDS.items():
+            if name not in values:
+                raise ValueError(f"Missing runtime setting {name}")
+            value = cast(values[name])
+            if name == "log_level":
+                value = value.upper()
+            object.__setattr__(self, name, value)
+        
+        self._validate()
+    
+    def _validate(self):
+        """Reject values that would break requests, so a bad update is never published"""
+        if not self.openai_model or not self.openai_fast_model:
+            raise ValueError("model names must not be empty")
+        if self.openai_max_tokens <= 0 or self.openai_fast_max_tokens <= 0:
+            raise ValueError("max tokens must be positive")
+        if not 0 <= self.openai_temperature <= 2:
+            raise ValueError("temperature must be between 0 and 2")
+        if self.daily_token_quota < 0:
+            raise ValueError("daily token quota must not be negative (0 means unlimited)")
+        if self.debounce_seconds < 0:
+            raise ValueError("debounce seconds must not be negative (0 disables debouncing)")
+        if self.request_deadline_seconds <= 0:
+            raise ValueError("request deadline must be positive")
+        if self.log_level not in self.LOG_LEVELS:
+            raise ValueError(f"log level must be one of {', '.join(self.LOG_LEVELS)}")
+    
+    def __setattr__(self, name, value):
+        raise AttributeError("RuntimeSettings is immutable, use replace() instead")
+    
+    def replace(self, **changes) -> "RuntimeSettings":
+        """Return a new snapshot with the given settings changed"""
+        unknown = set(changes) - set(self.FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown runtime setting(s): {', '.join(sorted(unknown))}")
+        
+        values = self.to_dict()
+        values.update(changes)
+        return RuntimeSettings(**values)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Get settings as a plain dictionary"""
+        return {name: getattr(self, name) for name in self.FIELDS}
+
 class Config:
     """Configuration class for bot settings"""
     
@@ -22,20 +91,171 @@ class Config:
         self.bot_username = os.getenv("BOT_USERNAME", "ai_coding_assistant_bot")
         self.admin_user_ids = self._parse_admin_ids(os.getenv("ADMIN_USER_IDS", ""))
         
-        # API configuration
-        self.openai_max_tokens = int(os.getenv("OPENAI_MAX_TOKENS", "2000"))
-        self.openai_temperature = float(os.getenv("OPENAI_TEMPERATURE", "0.7"))
-        self.openai_model = "gpt-4o"
+        # Runtime-tunable settings (API, quotas, logging). Readers always go
+        # through self.settings, which is swapped atomically on every reload.
+        self._settings = RuntimeSettings(
+            openai_model=os.getenv("OPENAI_MODEL", "gpt-4o"),
+            openai_max_tokens=os.getenv("OPENAI_MAX_TOKENS", "2000"),
+            openai_temperature=os.getenv("OPENAI_TEMPERATURE", "0.7"),
+            openai_fast_model=os.getenv("OPENAI_FAST_MODEL", "gpt-4o-mini"),
+            openai_fast_max_tokens=os.getenv("OPENAI_FAST_MAX_TOKENS", "300"),
+            daily_token_quota=os.getenv("DAILY_TOKEN_QUOTA", "0"),
+            debounce_seconds=os.getenv("DEBOUNCE_SECONDS", "1.5"),
+            request_deadline_seconds=os.getenv("REQUEST_DEADLINE_SECONDS", "60"),
+            log_level=os.getenv("LOG_LEVEL", "INFO"),
+        )
         
-        # Rate limiting configuration
+        # Rate limiting is read once at startup: RateLimiter is constructed with its own
+        # defaults, so these are not live-tunable until the limiter reads them
         self.rate_limit_requests = int(os.getenv("RATE_LIMIT_REQUESTS", "10"))
         self.rate_limit_window = int(os.getenv("RATE_LIMIT_WINDOW", "60"))
         
-        # Logging configuration
-        self.log_level = os.getenv("LOG_LEVEL", "INFO")
+        # Optional file with runtime overrides, reloaded when it changes or on SIGHUP
+        self.runtime_config_file = os.getenv("RUNTIME_CONFIG_FILE")
+        self.runtime_config_poll_interval = float(os.getenv("RUNTIME_CONFIG_POLL_INTERVAL", "5"))
+        self._runtime_config_mtime: Optional[float] = None
+        self._update_lock = threading.Lock()
+        self._watcher_thread: Optional[threading.Thread] = None
+        self._reload_requested = threading.Event()
+        
+        # Token usage accounting storage
+        self.usage_storage_file = os.getenv("USAGE_STORAGE_FILE", "usage_stats.json")
+        self.usage_flush_batch_size = int(os.getenv("USAGE_FLUSH_BATCH_SIZE", "20"))
+        self.usage_flush_interval = float(os.getenv("USAGE_FLUSH_INTERVAL", "60"))
+        self.usage_retention_days = int(os.getenv("USAGE_RETENTION_DAYS", "30"))
+        
+        # Profiling (event loop watchdog is off when the threshold is 0)
+        self.profile_output_dir = os.getenv("PROFILE_OUTPUT_DIR", "profiles")
+        self.profile_signal_duration = float(os.getenv("PROFILE_SIGNAL_DURATION", "30"))
+        self.slow_callback_threshold = float(os.getenv("SLOW_CALLBACK_THRESHOLD", "0"))
+        
+        # Group chat mode: answer only mentions, replies and trigger pattern matches.
+        # group_context_size is the number of group messages kept and sent with each reply.
+        self.group_trigger_pattern = os.getenv("GROUP_TRIGGER_PATTERN", r"\bbaba(tunde)?\b")
+        self.group_context_size = int(os.getenv("GROUP_CONTEXT_SIZE", "30"))
+        self.group_max_chats = int(os.getenv("GROUP_MAX_CHATS", "1000"))
+        
+        # Inline queries are served from a precomputed answer cache
+        self.inline_cache_time = int(os.getenv("INLINE_CACHE_TIME", "300"))
+        self.inline_live_deadline = float(os.getenv("INLINE_LIVE_DEADLINE", "1.5"))
+        self.inline_refresh_interval = float(os.getenv("INLINE_REFRESH_INTERVAL", "300"))
+        self.inline_answer_ttl = float(os.getenv("INLINE_ANSWER_TTL", "3600"))
+        
+        # Long-term memory retrieval of older turns (private chats). The real ceiling is
+        # memory_max_total_turns: each turn slot takes a 2 KB embedding (512 float32) plus
+        # at most ~600 characters of text, so the default 50000 is about 140 MB.
+        self.memory_top_k = int(os.getenv("MEMORY_TOP_K", "3"))
+        self.memory_max_turns = int(os.getenv("MEMORY_MAX_TURNS", "5000"))
+        self.memory_max_users = int(os.getenv("MEMORY_MAX_USERS", "1000"))
+        self.memory_max_total_turns = int(os.getenv("MEMORY_MAX_TOTAL_TURNS", "50000"))
+        self.memory_min_similarity = float(os.getenv("MEMORY_MIN_SIMILARITY", "0.25"))
+        
+        if self.runtime_config_file:
+            self.reload_from_file()
         
         self._validate_config()
     
+    @property
+    def settings(self) -> RuntimeSettings:
+        """Current runtime settings snapshot (lock-free read)"""
+        return self._settings
+    
+    @property
+    def openai_model(self) -> str:
+        return self._settings.openai_model
+    
+    @property
+    def openai_max_tokens(self) -> int:
+        return self._settings.openai_max_tokens
+    
+    @property
+    def openai_temperature(self) -> float:
+        return self._settings.openai_temperature
+    
+    @property
+    def daily_token_quota(self) -> int:
+        return self._settings.daily_token_quota
+    
+    @property
+    def log_level(self) -> str:
+        return self._settings.log_level
+    
+    def update_settings(self, **changes) -> RuntimeSettings:
+        """
+        Apply changes to the runtime settings
+        
+        A new snapshot is built and published with a single reference swap, so
+        requests already in flight keep the snapshot they started with and the
+        next request sees the new values.
+        
+        Raises:
+            ValueError: If a setting is unknown or a value is invalid (nothing is changed)
+        """
+        with self._update_lock:
+            old_settings = self._settings
+            new_settings = old_settings.replace(**changes)
+            self._settings = new_settings
+        
+        if new_settings.log_level != old_settings.log_level:
+            logging.getLogger().setLevel(new_settings.log_level)
+        
+        changed = {
+            name: value for name, value in new_settings.to_dict().items()
+            if getattr(old_settings, name) != value
+        }
+        if changed:
+            logger.info(f"Runtime settings updated: {changed}")
+        return new_settings
+    
+    def reload_from_file(self) -> bool:
+        """Reload runtime settings from the runtime config file (JSON object)"""
+        if not self.runtime_config_file:
+            return False
+        
+        try:
+            self._runtime_config_mtime = os.path.getmtime(self.runtime_config_file)
+            with open(self.runtime_config_file, "r", encoding="utf-8") as f:
+                overrides = json.load(f)
+            if not isinstance(overrides, dict):
+                raise ValueError("runtime config file must contain a JSON object")
+            self.update_settings(**overrides)
+            return True
+        except Exception as e:
+            # Keep serving with the previous settings on a bad file
+            logger.error(f"Failed to reload runtime config from {self.runtime_config_file}: {e}")
+            return False
+    
+    def start_watching(self):
+        """Start watching the runtime config file and listening for SIGHUP"""
+        if not self.runtime_config_file or self._watcher_thread is not None:
+            return
+        
+        # The signal handler only sets a flag; the watcher thread does the reload, so the
+        # handler never waits on the update lock held by the thread it interrupted
+        if hasattr(signal, "SIGHUP") and threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGHUP, lambda signum, frame: self._reload_requested.set())
+            logger.info("Runtime config reload on SIGHUP enabled")
+        
+        self._watcher_thread = threading.Thread(
+            target=self._watch_file, name="runtime-config-watcher", daemon=True
+        )
+        self._watcher_thread.start()
+        logger.info(f"Watching runtime config file {self.runtime_config_file}")
+    
+    def _watch_file(self):
+        """Reload on SIGHUP or when the runtime config file modification time changes"""
+        while True:
+            if self._reload_requested.wait(self.runtime_config_poll_interval):
+                self._reload_requested.clear()
+                self.reload_from_file()
+                continue
+            try:
+                mtime = os.path.getmtime(self.runtime_config_file)
+            except OSError:
+                continue
+            if mtime != self._runtime_config_mtime:
+                self.reload_from_file()
+    
     def _get_required_env(self, key: str) -> str:
         """Get required environment variable"""
         value = os.getenv(key)
@@ -78,8 +298,13 @@ class Config:
         logger.info(f"  - OpenAI max tokens: {self.openai_max_tokens}")
         logger.info(f"  - OpenAI temperature: {self.openai_temperature}")
         logger.info(f"  - OpenAI model: {self.openai_model}")
+        logger.info(f"  - OpenAI fast model: {self.settings.openai_fast_model} "
+                    f"(max tokens: {self.settings.openai_fast_max_tokens})")
         logger.info(f"  - Using OpenAI API directly")
         logger.info(f"  - Rate limit: {self.rate_limit_requests} requests per {self.rate_limit_window} seconds")
+        logger.info(f"  - Message debounce: {self.settings.debounce_seconds} seconds")
+        logger.info(f"  - Request deadline: {self.settings.request_deadline_seconds} seconds")
+        logger.info(f"  - Daily token quota: {self.daily_token_quota or 'unlimited'}")
     
     def is_admin(self, user_id: int) -> bool:
         """Check if user is an admin"""
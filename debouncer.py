@@ -0,0 +1,85 @@
+"""
+Per-chat debouncing of rapid message bursts into a single completion
+"""
+import asyncio
+import logging
+from typing import Dict, Hashable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _ChatState:
+    """Messages waiting for a completion and the task currently serving them"""
+
+    __slots__ = ("parts", "generation", "task")
+
+    def __init__(self):
+        self.parts: List[str] = []
+        self.generation = 0
+        self.task: Optional[asyncio.Task] = None
+
+
+class MessageDebouncer:
+    """
+    Merges messages that arrive within a quiet period into one user turn
+
+    Every message handler calls submit(). Only the handler of the last message
+    of a burst gets the merged text back; the others get None and stop. If a new
+    message arrives while a completion is still in flight, that completion's task
+    is cancelled and its text is merged into the next turn.
+    """
+
+    def __init__(self):
+        self._states: Dict[Hashable, _ChatState] = {}
+        self.messages_merged = 0
+        self.completions_superseded = 0
+
+    async def submit(self, key: Hashable, text: str, quiet_period: float) -> Optional[str]:
+        """
+        Add a message to the chat's pending turn and wait for the quiet period
+
+        Args:
+            key: Debounce key (chat, or chat and user in groups)
+            text: Message text
+            quiet_period: Seconds without new messages before the turn is dispatched
+
+        Returns:
+            Merged text of the turn if this handler should dispatch it, otherwise None
+        """
+        state = self._states.get(key)
+        if state is None:
+            state = self._states[key] = _ChatState()
+
+        state.parts.append(text)
+        state.generation += 1
+        generation = state.generation
+
+        # A newer message supersedes the completion still in flight
+        if state.task is not None and not state.task.done():
+            state.task.cancel()
+            state.task = None
+            self.completions_superseded += 1
+            logger.info(f"Superseded in-flight completion for {key}")
+
+        if quiet_period > 0:
+            await asyncio.sleep(quiet_period)
+
+        if state.generation != generation:
+            self.messages_merged += 1
+            return None
+
+        state.task = asyncio.current_task()
+        return "\n".join(state.parts)
+
+    def discard_chat(self, chat_id: int):
+        """Drop pending messages of a chat (keys are chat_id or (chat_id, user_id))"""
+        for key in list(self._states):
+            if key == chat_id or (isinstance(key, tuple) and key[0] == chat_id):
+                # Bump the generation so handlers still waiting out the quiet period stop
+                self._states.pop(key).generation += 1
+
+    def complete(self, key: Hashable):
+        """Mark the dispatched turn as finished (answered, rejected or failed)"""
+        state = self._states.get(key)
+        if state is not None and state.task is asyncio.current_task():
+            del self._states[key]
@@ -0,0 +1,94 @@
+"""
+Group chat support: cheap local filtering of messages and shared per-group context
+"""
+import logging
+import re
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+GROUP_CHAT_TYPES = ("group", "supergroup")
+
+
+def is_group_chat(chat_type: str) -> bool:
+    """Check if a Telegram chat type is a group chat"""
+    return chat_type in GROUP_CHAT_TYPES
+
+
+class GroupChatFilter:
+    """Decides locally, without calling the model, whether a group message is addressed to the bot"""
+
+    def __init__(self, trigger_pattern: Optional[str] = None):
+        self.trigger = re.compile(trigger_pattern, re.IGNORECASE) if trigger_pattern else None
+
+    def should_respond(self, text: str, bot_username: Optional[str], is_reply_to_bot: bool) -> bool:
+        """
+        Check if the bot should answer a group message
+
+        Args:
+            text: Message text
+            bot_username: Bot username without the leading @
+            is_reply_to_bot: Whether the message replies to one of the bot's messages
+
+        Returns:
+            True if the bot is mentioned, replied to or the trigger pattern matches
+        """
+        if is_reply_to_bot:
+            return True
+
+        if bot_username and f"@{bot_username.lower()}" in text.lower():
+            return True
+
+        return bool(self.trigger and self.trigger.search(text))
+
+
+class GroupContextStore:
+    """Shared, bounded conversation context per group chat"""
+
+    def __init__(self, max_messages: int = 30, max_groups: int = 1000):
+        self.max_messages = max_messages
+        self.max_groups = max_groups
+        # Least recently active group is evicted first
+        self._contexts: "OrderedDict[int, deque]" = OrderedDict()
+
+    def _get(self, chat_id: int) -> deque:
+        context = self._contexts.get(chat_id)
+        if context is None:
+            context = self._contexts[chat_id] = deque(maxlen=self.max_messages)
+            if len(self._contexts) > self.max_groups:
+                evicted_id, _ = self._contexts.popitem(last=False)
+                logger.debug(f"Evicted context of inactive group {evicted_id}")
+        else:
+            self._contexts.move_to_end(chat_id)
+        return context
+
+    def add_user_message(self, chat_id: int, speaker: str, text: str):
+        """Record a group member's message, prefixed with who said it"""
+        self._get(chat_id).append({"role": "user", "content": f"{speaker}: {text}"})
+
+    def add_assistant_message(self, chat_id: int, text: str):
+        """Record the bot's reply in the group context"""
+        self._get(chat_id).append({"role": "assistant", "content": text})
+
+    def get_history(self, chat_id: int) -> List[Dict[str, str]]:
+        """Get the group's conversation context"""
+        return list(self._get(chat_id))
+
+    def get_exchanges(self, chat_id: int) -> List[Dict[str, str]]:
+        """
+        Get only the bot's own exchanges from the group's context
+
+        Used to judge conversation depth, so unaddressed chatter between members
+        does not make every reply look like a deep conversation.
+        """
+        history = self.get_history(chat_id)
+        exchanges = []
+        for message, reply in zip(history, history[1:]):
+            if message["role"] == "user" and reply["role"] == "assistant":
+                exchanges += [message, reply]
+        return exchanges
+
+    def clear(self, chat_id: int):
+        """Forget a group's conversation context"""
+        self._contexts.pop(chat_id, None)
@@ -0,0 +1,199 @@
+"""
+Precomputed answer cache for inline queries
+"""
+import hashlib
+import logging
+import os
+import re
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Prompts the cache is seeded with from the local persona phrase bank
+SEED_PROMPTS = (
+    "hello",
+    "how are you",
+    "good morning",
+    "what you eat today",
+    "how is the weather",
+    "tell me about your village",
+    "tell me about your goat",
+    "tell me a joke",
+)
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def normalize_prompt(text: str) -> str:
+    """Normalize a prompt so that trivially different phrasings share a cache entry"""
+    return " ".join(WORD_PATTERN.findall(text.lower()))
+
+
+def result_id(prompt: str) -> str:
+    """Stable inline result ID for a prompt (Telegram allows at most 64 bytes)"""
+    return hashlib.md5(prompt.encode("utf-8")).hexdigest()
+
+
+class _CachedAnswer:
+    __slots__ = ("answer", "updated_at")
+
+    def __init__(self, answer: str):
+        self.answer = answer
+        self.updated_at = time.monotonic()
+
+
+class InlineAnswerCache:
+    """
+    Answers for popular prompts, warmed from recent traffic and refreshed in the background
+
+    A prompt learned from traffic is only used once min_users distinct users have
+    sent it in private chats, and answers are generated without any conversation
+    context. An empty inline query only lists the seeded prompts, never learned ones.
+    """
+
+    def __init__(self, answer_ttl: float = 3600, min_users: int = 5, max_prompt_chars: int = 60,
+                 max_tracked: int = 2000, max_answers: int = 500, max_users_per_prompt: int = 100):
+        self.answer_ttl = answer_ttl
+        self.min_users = min_users
+        self.max_prompt_chars = max_prompt_chars
+        self.max_tracked = max_tracked
+        self.max_answers = max_answers
+        self.max_users_per_prompt = max_users_per_prompt
+
+        # Prompt -> salted hashes of the users who sent it (user IDs are never stored)
+        self._senders: Dict[str, Set[bytes]] = {}
+        self._seeded: Set[str] = set()
+        self._salt = os.urandom(16)
+        self._answers: Dict[str, _CachedAnswer] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _popularity(self, prompt: str) -> int:
+        """Number of distinct senders, with seeded prompts counted as popular"""
+        senders = len(self._senders.get(prompt, ()))
+        return senders + self.min_users if prompt in self._seeded else senders
+
+    def seed(self, prompt: str, answer: Optional[str] = None):
+        """Add a prompt treated as popular from the start, with a precomputed answer if given"""
+        prompt = normalize_prompt(prompt)
+        if not prompt:
+            return
+        self._seeded.add(prompt)
+        if answer:
+            self._answers[prompt] = _CachedAnswer(answer)
+
+    def record_prompt(self, text: str, user_id: int):
+        """
+        Count a private-chat prompt towards its popularity
+
+        Group messages must not be recorded: they are not the sender's own
+        small talk and would be shown to other users once popular.
+        """
+        if len(text) > self.max_prompt_chars:
+            return
+        prompt = normalize_prompt(text)
+        if not prompt:
+            return
+
+        senders = self._senders.setdefault(prompt, set())
+        if len(senders) < self.max_users_per_prompt:
+            senders.add(hashlib.blake2b(str(user_id).encode("utf-8"), key=self._salt, digest_size=8).digest())
+
+        if len(self._senders) > self.max_tracked:
+            # Forget the least popular half
+            ranked = sorted(self._senders, key=lambda p: len(self._senders[p]), reverse=True)
+            for forgotten in ranked[self.max_tracked // 2:]:
+                del self._senders[forgotten]
+
+    def store(self, prompt: str, answer: str):
+        """Store an answer for a prompt"""
+        self._answers[normalize_prompt(prompt)] = _CachedAnswer(answer)
+
+    def lookup(self, query: str, limit: int = 10) -> List[Tuple[str, str]]:
+        """
+        Find cached answers for an inline query
+
+        Args:
+            query: Inline query text (empty query returns the seeded answers only)
+            limit: Maximum number of results
+
+        Returns:
+            List of (prompt, answer) pairs, best match first
+        """
+        query = normalize_prompt(query)
+        query_words = set(query.split())
+        scored = []
+
+        for prompt, cached in self._answers.items():
+            if self._popularity(prompt) < self.min_users:
+                continue
+            if not query:
+                # Never list learned prompts to someone who has not typed anything
+                if prompt not in self._seeded:
+                    continue
+                score = 0.0
+            elif prompt == query:
+                score = 3.0
+            elif prompt.startswith(query):
+                score = 2.0
+            elif query in prompt:
+                score = 1.0
+            else:
+                overlap = len(query_words & set(prompt.split()))
+                if not overlap:
+                    continue
+                score = overlap / len(query_words)
+            scored.append((score, self._popularity(prompt), prompt, cached.answer))
+
+        scored.sort(key=lambda item: (item[0], item[1]), reverse=True)
+        if scored:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return [(prompt, answer) for _, _, prompt, answer in scored[:limit]]
+
+    def prompts_to_refresh(self, limit: int) -> List[str]:
+        """Get popular prompts whose answers are missing or stale, most popular first"""
+        now = time.monotonic()
+        result = []
+        ranked = sorted(self._seeded | set(self._senders), key=self._popularity, reverse=True)
+        for prompt in ranked:
+            if self._popularity(prompt) < self.min_users or len(result) >= limit:
+                break
+            cached = self._answers.get(prompt)
+            if cached is None or now - cached.updated_at >= self.answer_ttl:
+                result.append(prompt)
+        return result
+
+    async def refresh(self, generate: Callable[[str], Awaitable[Optional[str]]], batch_size: int = 5) -> int:
+        """
+        Generate answers for a batch of popular prompts that are missing or stale
+
+        Args:
+            generate: Coroutine function producing an answer for a prompt
+            batch_size: Maximum number of answers to generate in this refresh
+
+        Returns:
+            Number of answers refreshed
+        """
+        refreshed = 0
+        for prompt in self.prompts_to_refresh(batch_size):
+            try:
+                answer = await generate(prompt)
+            except Exception as e:
+                logger.warning(f"Failed to refresh inline answer for '{prompt}': {e}")
+                continue
+            if answer:
+                self.store(prompt, answer)
+                refreshed += 1
+
+        # Keep only answers for the most popular prompts
+        if len(self._answers) > self.max_answers:
+            ranked = sorted(self._answers, key=self._popularity, reverse=True)
+            for prompt in ranked[self.max_answers:]:
+                del self._answers[prompt]
+
+        if refreshed:
+            logger.info(f"Refreshed {refreshed} inline answers ({len(self._answers)} cached)")
+        return refreshed
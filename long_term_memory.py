@@ -0,0 +1,170 @@
+"""
+Long-term conversation memory: hashed embeddings of past turns with vectorized retrieval per user
+"""
+import logging
+import re
+import zlib
+from collections import OrderedDict
+from typing import List
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+class HashingEmbedder:
+    """Cheap local text embedding: signed feature hashing of word unigrams and bigrams"""
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+
+    def embed(self, text: str) -> np.ndarray:
+        """Embed text into an L2-normalized float32 vector"""
+        words = WORD_PATTERN.findall(text.lower())
+        features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        vector = np.zeros(self.dim, dtype=np.float32)
+        if not features:
+            return vector
+
+        # crc32 is stable across processes, unlike the built-in hash()
+        hashes = np.fromiter((zlib.crc32(f.encode("utf-8")) for f in features), dtype=np.uint32, count=len(features))
+        indices = (hashes % self.dim).astype(np.intp)
+        signs = np.where((hashes >> 31) & 1, -1.0, 1.0).astype(np.float32)
+        np.add.at(vector, indices, signs)
+
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector
+
+
+class _UserIndex:
+    """Embeddings and texts of one user's past turns, in insertion order"""
+
+    __slots__ = ("vectors", "texts", "size")
+
+    def __init__(self, dim: int, capacity: int = 64):
+        self.vectors = np.empty((capacity, dim), dtype=np.float32)
+        self.texts: List[str] = []
+        self.size = 0
+
+    def add(self, vector: np.ndarray, text: str, max_turns: int):
+        if self.size == max_turns:
+            # Drop the oldest tenth at once so the shift is amortized over many appends
+            drop = max(1, max_turns // 10)
+            self.vectors[:self.size - drop] = self.vectors[drop:self.size]
+            del self.texts[:drop]
+            self.size -= drop
+        elif self.size == len(self.vectors):
+            # Grow geometrically so appends stay amortized O(1)
+            grown = np.empty((min(len(self.vectors) * 2, max_turns), self.vectors.shape[1]), dtype=np.float32)
+            grown[:self.size] = self.vectors[:self.size]
+            self.vectors = grown
+
+        self.vectors[self.size] = vector
+        self.texts.append(text)
+        self.size += 1
+
+
+class LongTermMemory:
+    """
+    Per-user index of past turns; retrieves only the few old turns relevant to the current message
+
+    Memory is bounded by max_total_turns allocated rows across all users, each taking
+    dim * 4 bytes for the embedding plus up to 2 * max_text_chars characters of text.
+    """
+
+    def __init__(self, dim: int = 512, max_turns: int = 5000, max_users: int = 1000,
+                 max_total_turns: int = 50000, top_k: int = 3, min_similarity: float = 0.25,
+                 exclude_recent: int = 5, max_text_chars: int = 300):
+        """
+        Args:
+            dim: Embedding dimension
+            max_turns: Maximum turns kept per user (oldest dropped first)
+            max_users: Maximum users indexed (least recently active evicted first)
+            max_total_turns: Maximum turn slots allocated across all users (least recently active evicted first)
+            top_k: Maximum number of turns retrieved per request
+            min_similarity: Minimum cosine similarity for a turn to be retrieved
+            exclude_recent: Number of most recent turns not searched, as they are still in the prompt
+            max_text_chars: Maximum characters stored of each user message and reply, bounding the prompt size
+        """
+        self.embedder = HashingEmbedder(dim)
+        self.max_turns = max_turns
+        self.max_users = max_users
+        self.max_total_turns = max_total_turns
+        self.max_text_chars = max_text_chars
+        self.top_k = top_k
+        self.min_similarity = min_similarity
+        self.exclude_recent = exclude_recent
+        # Least recently active user is evicted first
+        self._indexes: "OrderedDict[int, _UserIndex]" = OrderedDict()
+        # Turn slots allocated across all indexes, including unused growth capacity
+        self._allocated_turns = 0
+
+    def add_turn(self, user_id: int, user_message: str, assistant_message: str):
+        """Store an answered exchange in the user's index"""
+        # Only a truncated exchange is stored, so retrieved memories keep the prompt small
+        text = f"User: {self._truncate(user_message)}\nYou: {self._truncate(assistant_message)}"
+        index = self._indexes.get(user_id)
+        if index is None:
+            index = self._indexes[user_id] = _UserIndex(self.embedder.dim)
+            self._allocated_turns += len(index.vectors)
+        else:
+            self._indexes.move_to_end(user_id)
+
+        # Embed what the user said; that is what later questions refer back to
+        allocated = len(index.vectors)
+        index.add(self.embedder.embed(user_message), text, self.max_turns)
+        self._allocated_turns += len(index.vectors) - allocated
+
+        # The current user is the most recent, so it is evicted last
+        while len(self._indexes) > 1 and (
+            len(self._indexes) > self.max_users or self._allocated_turns > self.max_total_turns
+        ):
+            evicted_id, evicted = self._indexes.popitem(last=False)
+            self._allocated_turns -= len(evicted.vectors)
+            logger.debug(f"Evicted long-term memory of inactive user {evicted_id}")
+
+    def _truncate(self, text: str) -> str:
+        if len(text) <= self.max_text_chars:
+            return text
+        return text[:self.max_text_chars].rstrip() + "..."
+
+    def search(self, user_id: int, query: str) -> List[str]:
+        """
+        Retrieve the user's older turns most relevant to a query
+
+        Returns:
+            Up to top_k turn texts, most similar first
+        """
+        index = self._indexes.get(user_id)
+        if index is None:
+            return []
+        self._indexes.move_to_end(user_id)
+
+        searchable = index.size - self.exclude_recent
+        if searchable <= 0:
+            return []
+
+        query_vector = self.embedder.embed(query)
+        if not query_vector.any():
+            return []
+
+        similarities = index.vectors[:searchable] @ query_vector
+        k = min(self.top_k, searchable)
+        top = np.argpartition(similarities, -k)[-k:]
+        top = top[np.argsort(similarities[top])[::-1]]
+        return [index.texts[i] for i in top if similarities[i] >= self.min_similarity]
+
+    def turn_count(self, user_id: int) -> int:
+        """Number of turns stored for a user"""
+        index = self._indexes.get(user_id)
+        return index.size if index else 0
+
+    def clear(self, user_id: int):
+        """Forget all long-term memory of a user"""
+        index = self._indexes.pop(user_id, None)
+        if index is not None:
+            self._allocated_turns -= len(index.vectors)
@@ -0,0 +1,115 @@
+"""
+Request classification and model tier routing
+"""
+import logging
+import re
+from typing import Dict, List, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+TIER_FAST = "fast"
+TIER_FULL = "full"
+
+
+class ModelTier:
+    """Model and token budget used for a class of requests"""
+
+    __slots__ = ("name", "model", "max_tokens")
+
+    def __init__(self, name: str, model: str, max_tokens: int):
+        self.name = name
+        self.model = model
+        self.max_tokens = max_tokens
+
+
+class RequestClassifier:
+    """Cheap local classifier that decides which model tier a request needs"""
+
+    GREETING_KEYWORDS = {
+        "hi", "hello", "hey", "yo", "sup", "hola", "salut", "bonjour", "salam", "morning",
+        "evening", "night", "thanks", "thank", "thx", "ok", "okay", "bye", "lol", "haha",
+        "bratha", "how", "are", "you", "u", "good", "fine", "cool", "nice", "wassup", "whats", "up",
+    }
+
+    COMPLEX_KEYWORDS = (
+        "explain", "why", "story", "describe", "compare", "difference", "write", "translate",
+        "recipe", "advice", "help me", "tell me about", "what do you think", "step by step",
+    )
+
+    # Whole words/phrases only, so e.g. "story" does not match "history"
+    COMPLEX_PATTERN = re.compile(r"\b(?:" + "|".join(re.escape(k) for k in COMPLEX_KEYWORDS) + r")\b")
+
+    WORD_PATTERN = re.compile(r"[a-zA-Z']+")
+
+    def __init__(self, short_message_chars: int = 80, long_message_chars: int = 300,
+                 deep_conversation_turns: int = 6):
+        self.short_message_chars = short_message_chars
+        self.long_message_chars = long_message_chars
+        self.deep_conversation_turns = deep_conversation_turns
+
+    def classify(self, user_message: str, conversation_history: Optional[List[Dict[str, Any]]] = None) -> str:
+        """
+        Pick a model tier for a request
+
+        Args:
+            user_message: Current user message
+            conversation_history: Previous conversation context
+
+        Returns:
+            TIER_FAST for small talk, TIER_FULL otherwise
+        """
+        text = user_message.strip().lower()
+
+        if len(text) > self.long_message_chars:
+            return TIER_FULL
+
+        if self.COMPLEX_PATTERN.search(text):
+            return TIER_FULL
+
+        words = self.WORD_PATTERN.findall(text)
+        if words and all(word in self.GREETING_KEYWORDS for word in words):
+            return TIER_FAST
+
+        user_turns = sum(1 for message in conversation_history or [] if message.get("role") == "user")
+        if user_turns >= self.deep_conversation_turns:
+            return TIER_FULL
+
+        if len(text) <= self.short_message_chars:
+            return TIER_FAST
+
+        return TIER_FULL
+
+
+class TierStats:
+    """Per-tier latency and token counters"""
+
+    def __init__(self):
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def record(self, tier: str, latency: float, prompt_tokens: int = 0, completion_tokens: int = 0):
+        """Record one completion served by a tier"""
+        stats = self._stats.get(tier)
+        if stats is None:
+            stats = self._stats[tier] = {
+                "requests": 0, "latency_total": 0.0, "latency_max": 0.0,
+                "prompt_tokens": 0, "completion_tokens": 0,
+            }
+        stats["requests"] += 1
+        stats["latency_total"] += latency
+        stats["latency_max"] = max(stats["latency_max"], latency)
+        stats["prompt_tokens"] += prompt_tokens
+        stats["completion_tokens"] += completion_tokens
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Get per-tier request count, average/max latency and average tokens"""
+        result = {}
+        for tier, stats in self._stats.items():
+            requests = stats["requests"]
+            result[tier] = {
+                "requests": requests,
+                "avg_latency": stats["latency_total"] / requests,
+                "max_latency": stats["latency_max"],
+                "avg_tokens": (stats["prompt_tokens"] + stats["completion_tokens"]) / requests,
+                "total_tokens": stats["prompt_tokens"] + stats["completion_tokens"],
+            }
+        return result
@@ -0,0 +1,201 @@
+"""
+On-demand profiling: handler timing, event loop stall detection and sampling profiler sessions
+"""
+import asyncio
+import functools
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from typing import Dict, Optional, Callable, Awaitable
+
+logger = logging.getLogger(__name__)
+
+
+class Profiler:
+    """Profiling surface that costs nothing beyond two clock reads per handler when idle"""
+
+    def __init__(self, output_dir: str = "profiles", sample_interval: float = 0.005):
+        self.output_dir = output_dir
+        self.sample_interval = sample_interval
+
+        # Handler name -> calls, wall time and CPU time
+        self.handler_stats: Dict[str, Dict[str, float]] = {}
+
+        self._session_thread: Optional[threading.Thread] = None
+        self._signal_thread: Optional[threading.Thread] = None
+        self._session_requested = threading.Event()
+        self._watchdog_thread: Optional[threading.Thread] = None
+        self._watchdog_stop = threading.Event()
+        self._loop_thread_id: Optional[int] = None
+        self._last_beat = 0.0
+        self.stalls_detected = 0
+
+    def track(self, name: str, handler: Callable[..., Awaitable]) -> Callable[..., Awaitable]:
+        """
+        Wrap an async handler to count its calls, wall time and CPU time
+
+        CPU time is measured on the event loop thread, so it also includes work
+        of other tasks that ran while the handler was awaiting.
+        """
+        @functools.wraps(handler)
+        async def wrapper(*args, **kwargs):
+            wall_start = time.perf_counter()
+            cpu_start = time.thread_time()
+            try:
+                return await handler(*args, **kwargs)
+            finally:
+                stats = self.handler_stats.get(name)
+                if stats is None:
+                    stats = self.handler_stats[name] = {"calls": 0, "wall": 0.0, "cpu": 0.0, "wall_max": 0.0}
+                wall = time.perf_counter() - wall_start
+                stats["calls"] += 1
+                stats["wall"] += wall
+                stats["cpu"] += time.thread_time() - cpu_start
+                stats["wall_max"] = max(stats["wall_max"], wall)
+
+        return wrapper
+
+    # Sampling profiler sessions
+
+    @property
+    def session_running(self) -> bool:
+        return self._session_thread is not None and self._session_thread.is_alive()
+
+    def start_session(self, duration: float) -> str:
+        """
+        Start a sampling profiler session in a background thread
+
+        Args:
+            duration: Session length in seconds
+
+        Returns:
+            Path of the collapsed-stack file that will be written (flamegraph.pl / speedscope compatible)
+
+        Raises:
+            RuntimeError: If a session is already running
+        """
+        if self.session_running:
+            raise RuntimeError("A profiling session is already running")
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, f"profile-{time.strftime('%Y%m%d-%H%M%S')}.folded")
+        self._session_thread = threading.Thread(
+            target=self._run_session, args=(duration, path), name="profiler-session", daemon=True
+        )
+        self._session_thread.start()
+        logger.info(f"Started {duration:.0f}s profiling session, writing to {path}")
+        return path
+
+    def _run_session(self, duration: float, path: str):
+        """Sample stacks of all other threads and write them in collapsed format"""
+        own_id = threading.get_ident()
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+        stacks = Counter()
+        samples = 0
+        deadline = time.monotonic() + duration
+
+        while time.monotonic() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                names = []
+                while frame is not None:
+                    code = frame.f_code
+                    names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                names.append(thread_names.get(thread_id, str(thread_id)))
+                stacks[";".join(reversed(names))] += 1
+            samples += 1
+            time.sleep(self.sample_interval)
+
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                for stack, count in stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            logger.info(f"Profiling session finished: {samples} samples written to {path}")
+        except OSError as e:
+            logger.error(f"Failed to write profile to {path}: {e}")
+
+    def install_signal_handler(self, duration: float = 30):
+        """Start a profiling session of the given length on SIGUSR1"""
+        if not hasattr(signal, "SIGUSR1") or threading.current_thread() is not threading.main_thread():
+            return
+        if self._signal_thread is not None:
+            return
+
+        # The signal handler only sets a flag; a listener thread starts the session, so the
+        # handler never takes threading or logging locks held by the code it interrupted
+        self._signal_thread = threading.Thread(
+            target=self._wait_for_signal, args=(duration,), name="profiler-signal", daemon=True
+        )
+        self._signal_thread.start()
+        signal.signal(signal.SIGUSR1, lambda signum, frame: self._session_requested.set())
+        logger.info("Profiling session on SIGUSR1 enabled")
+
+    def _wait_for_signal(self, duration: float):
+        """Start a profiling session each time SIGUSR1 was received"""
+        while True:
+            self._session_requested.wait()
+            self._session_requested.clear()
+            try:
+                self.start_session(duration)
+            except (RuntimeError, OSError) as e:
+                logger.warning(f"Ignoring SIGUSR1: {e}")
+
+    # Event loop stall detection
+
+    @property
+    def watchdog_running(self) -> bool:
+        return self._watchdog_thread is not None and self._watchdog_thread.is_alive()
+
+    def start_watchdog(self, loop: asyncio.AbstractEventLoop, threshold: float = 0.5):
+        """
+        Detect callbacks that block the event loop for longer than threshold seconds
+
+        The loop updates a heartbeat every threshold / 2 seconds; a watchdog thread
+        logs the loop thread's stack when the heartbeat is late.
+        """
+        if self.watchdog_running:
+            return
+
+        self._watchdog_stop.clear()
+        beat_interval = threshold / 2
+
+        def beat():
+            self._loop_thread_id = threading.get_ident()
+            self._last_beat = time.monotonic()
+            if not self._watchdog_stop.is_set():
+                loop.call_later(beat_interval, beat)
+
+        loop.call_soon_threadsafe(beat)
+        self._last_beat = time.monotonic()
+        self._watchdog_thread = threading.Thread(
+            target=self._watch_loop, args=(threshold, beat_interval), name="loop-watchdog", daemon=True
+        )
+        self._watchdog_thread.start()
+        logger.info(f"Event loop watchdog started (threshold {threshold}s)")
+
+    def stop_watchdog(self):
+        """Stop event loop stall detection"""
+        self._watchdog_stop.set()
+        logger.info("Event loop watchdog stopped")
+
+    def _watch_loop(self, threshold: float, beat_interval: float):
+        reported_beat = None
+        while not self._watchdog_stop.wait(beat_interval):
+            last_beat = self._last_beat
+            stalled_for = time.monotonic() - last_beat - beat_interval
+            if stalled_for < threshold or last_beat == reported_beat:
+                continue
+
+            # Report each stall once, with the stack that is blocking the loop
+            reported_beat = last_beat
+            self.stalls_detected += 1
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else "<unavailable>"
+            logger.warning(f"Event loop blocked for at least {stalled_for:.2f}s, current stack:\n{stack}")
@@ -0,0 +1,138 @@
+"""
+Request deadlines and cancellation of abandoned completions
+"""
+import asyncio
+import logging
+import time
+from collections import Counter
+from typing import Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Request stages, used to account for the work saved by a cancellation
+STAGE_QUEUED = "queued"
+STAGE_UPSTREAM = "upstream"
+STAGE_SENDING = "sending"
+
+
+class RequestCancelled(Exception):
+    """Raised when a request was cancelled or ran past its deadline"""
+
+    def __init__(self, reason: str):
+        super().__init__(f"Request cancelled: {reason}")
+        self.reason = reason
+
+
+class RequestContext:
+    """Deadline and cancellation token carried by one request through router, HTTP call and send path"""
+
+    def __init__(self, key: Hashable, timeout: float, task: Optional[asyncio.Task] = None):
+        self.key = key
+        self.deadline = time.monotonic() + timeout
+        self.task = task
+        self.stage = STAGE_QUEUED
+        self.cancelled_reason: Optional[str] = None
+
+    def remaining(self) -> float:
+        """Seconds left until the deadline"""
+        return max(0.0, self.deadline - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.deadline
+
+    def cancel(self, reason: str):
+        """Cancel the request and interrupt the task serving it"""
+        if self.cancelled_reason is not None:
+            return
+        self.cancelled_reason = reason
+        if self.task is not None and self.task is not asyncio.current_task() and not self.task.done():
+            self.task.cancel()
+
+    def check_cancelled(self):
+        """
+        Raise only if the request was explicitly cancelled (cleared or superseded)
+
+        Used once an answer has already been paid for, so it is not thrown away
+        just because it arrived slightly after the deadline.
+
+        Raises:
+            RequestCancelled: If the request was cancelled
+        """
+        if self.cancelled_reason is not None:
+            raise RequestCancelled(self.cancelled_reason)
+
+    def check(self):
+        """
+        Raise if the request should not continue
+
+        Raises:
+            RequestCancelled: If the request was cancelled or its deadline has passed
+        """
+        if self.cancelled_reason is None and self.expired:
+            self.cancelled_reason = "deadline"
+        if self.cancelled_reason is not None:
+            raise RequestCancelled(self.cancelled_reason)
+
+
+class RequestRegistry:
+    """Tracks the active request per conversation and counts the work saved by cancellations"""
+
+    def __init__(self):
+        self._active: Dict[Hashable, RequestContext] = {}
+        self.cancelled_by_reason = Counter()
+        self.cancelled_by_stage = Counter()
+
+    def start(self, key: Hashable, timeout: float) -> RequestContext:
+        """Start a request for a conversation, superseding the one still active"""
+        previous = self._active.get(key)
+        if previous is not None:
+            previous.cancel("superseded")
+
+        request = RequestContext(key, timeout, asyncio.current_task())
+        self._active[key] = request
+        return request
+
+    def cancel(self, key: Hashable, reason: str) -> bool:
+        """Cancel the active request of a conversation"""
+        request = self._active.get(key)
+        if request is None:
+            return False
+        request.cancel(reason)
+        return True
+
+    def cancel_chat(self, chat_id: int, reason: str) -> int:
+        """Cancel all active requests of a chat (keys are chat_id or (chat_id, user_id))"""
+        cancelled = 0
+        for key in list(self._active):
+            if key == chat_id or (isinstance(key, tuple) and key[0] == chat_id):
+                cancelled += self.cancel(key, reason)
+        return cancelled
+
+    def finish(self, request: RequestContext, cancelled_reason: Optional[str] = None):
+        """
+        Unregister a finished request and account for it if it was cancelled
+
+        Args:
+            request: The finished request
+            cancelled_reason: Reason to record if the request was interrupted without one set
+        """
+        if self._active.get(request.key) is request:
+            del self._active[request.key]
+
+        reason = request.cancelled_reason or cancelled_reason
+        if reason is None:
+            return
+        request.cancelled_reason = reason
+        self.cancelled_by_reason[reason] += 1
+        self.cancelled_by_stage[request.stage] += 1
+        logger.info(f"Request for {request.key} cancelled ({reason}) at stage {request.stage}")
+
+    def stats(self) -> Dict[str, int]:
+        """Get counters of work saved by cancellations"""
+        return {
+            "completions_avoided": self.cancelled_by_stage[STAGE_QUEUED],
+            "upstream_calls_aborted": self.cancelled_by_stage[STAGE_UPSTREAM],
+            "sends_aborted": self.cancelled_by_stage[STAGE_SENDING],
+            **{f"cancelled_{reason}": count for reason, count in self.cancelled_by_reason.items()},
+        }
@@ -6,9 +6,17 @@ import logging
 import sys
 from aiogram import Bot, Dispatcher, types
 from aiogram.filters import CommandStart, Command
-from aiogram.types import Message
+from aiogram.types import Message, InlineQuery, InlineQueryResultArticle, InputTextMessageContent
 from collections import defaultdict, deque
 import random
+import time
+
+from model_router import RequestClassifier, TierStats, TIER_FAST
+from group_chat import GroupChatFilter, GroupContextStore, is_group_chat
+from debouncer import MessageDebouncer
+from request_context import RequestContext, RequestRegistry, RequestCancelled, STAGE_UPSTREAM
+from inline_cache import InlineAnswerCache, SEED_PROMPTS, result_id
+from long_term_memory import LongTermMemory
 
 logging.basicConfig(
     level=logging.INFO,
@@ -24,8 +32,57 @@ OPENROUTER_KEY = "sk-or-v1-5f779b5bfeee06122ca35859346bcd66a3723a37a7f79cc9f09de
 bot = Bot(token=TOKEN)
 dp = Dispatcher()
 
+# Model tiers: small talk goes to the fast model with a small token budget.
+# Both tiers default to the same free model, so until OPENROUTER_FAST_MODEL is set
+# to a smaller one the fast tier only differs by its token budget.
+FAST_MODEL = os.getenv("OPENROUTER_FAST_MODEL", "mistralai/mistral-7b-instruct:free")
+FAST_MAX_TOKENS = int(os.getenv("OPENROUTER_FAST_MAX_TOKENS", "60"))
+FULL_MODEL = os.getenv("OPENROUTER_FULL_MODEL", "mistralai/mistral-7b-instruct:free")
+FULL_MAX_TOKENS = int(os.getenv("OPENROUTER_FULL_MAX_TOKENS", "120"))
+
 conversations = defaultdict(lambda: deque(maxlen=10))
 
+FALLBACK_RESPONSES = [
+    "Hey bratha! Brain no dey work good now. Try later, no worries.",
+    "Ah bratha, me get small wahala here. Come back soon!",
+    "You know, me no too sabi tech tings. Try again later, bratha.",
+]
+
+# Older turns are retrieved from a per-user index; the last 5 exchanges are already in the context
+long_term_memory = LongTermMemory(
+    max_turns=int(os.getenv("MEMORY_MAX_TURNS", "5000")),
+    max_users=int(os.getenv("MEMORY_MAX_USERS", "1000")),
+    max_total_turns=int(os.getenv("MEMORY_MAX_TOTAL_TURNS", "50000")),
+    top_k=int(os.getenv("MEMORY_TOP_K", "3")),
+    min_similarity=float(os.getenv("MEMORY_MIN_SIMILARITY", "0.25")),
+    exclude_recent=5
+)
+classifier = RequestClassifier()
+tier_stats = TierStats()
+
+# Group chats: one shared context per group, answers only when the bot is addressed
+group_filter = GroupChatFilter(os.getenv("GROUP_TRIGGER_PATTERN", r"\bbaba(tunde)?\b"))
+group_contexts = GroupContextStore(
+    max_messages=int(os.getenv("GROUP_CONTEXT_SIZE", "30")),
+    max_groups=int(os.getenv("GROUP_MAX_CHATS", "1000"))
+)
+
+# Messages arriving within the quiet period are merged into one completion
+DEBOUNCE_SECONDS = float(os.getenv("DEBOUNCE_SECONDS", "1.5"))
+debouncer = MessageDebouncer()
+
+# Every request carries a deadline; /clear and newer messages cancel abandoned ones
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "30"))
+requests_registry = RequestRegistry()
+
+# Inline queries are served from a cache of popular prompts refreshed in the background
+INLINE_CACHE_TIME = int(os.getenv("INLINE_CACHE_TIME", "300"))
+INLINE_LIVE_DEADLINE = float(os.getenv("INLINE_LIVE_DEADLINE", "1.5"))
+INLINE_REFRESH_INTERVAL = float(os.getenv("INLINE_REFRESH_INTERVAL", "300"))
+inline_cache = InlineAnswerCache(answer_ttl=float(os.getenv("INLINE_ANSWER_TTL", "3600")))
+for seed_prompt in SEED_PROMPTS:
+    inline_cache.seed(seed_prompt)
+
 @dp.message(CommandStart())
 async def start_handler(message: Message):
     user_id = message.from_user.id
@@ -39,32 +96,151 @@ async def start_handler(message: Message):
 @dp.message(Command(commands=["clear"]))
 async def clear_handler(message: Message):
     user_id = message.from_user.id
-    conversations[user_id].clear()
+    if is_group_chat(message.chat.type):
+        # The group context is shared, so only group admins may reset it
+        member = await bot.get_chat_member(message.chat.id, user_id)
+        if member.status not in ("administrator", "creator"):
+            await message.answer("Sorry bratha, only group admins can make me forget this group chat.")
+            return
+    debouncer.discard_chat(message.chat.id)
+    requests_registry.cancel_chat(message.chat.id, "cleared")
+    if is_group_chat(message.chat.type):
+        group_contexts.clear(message.chat.id)
+    else:
+        conversations[user_id].clear()
+        long_term_memory.clear(user_id)
     await message.answer("🗑️ Okay bratha! I forget everything now, we start fresh!")
 
 @dp.message()
 async def handle_message(message: Message):
     user_id = message.from_user.id
     text = message.text or ""
+    chat_id = message.chat.id
+    is_group = is_group_chat(message.chat.type)
+    speaker = message.from_user.first_name or "User"
+    debounce_key = (chat_id, user_id) if is_group else chat_id
+
+    if is_group:
+        reply_to = message.reply_to_message
+        is_reply_to_bot = bool(reply_to and reply_to.from_user and reply_to.from_user.id == bot.id)
+        me = await bot.me()
+        if not group_filter.should_respond(text, me.username, is_reply_to_bot):
+            # Unaddressed chatter only goes into the shared context, no model call
+            group_contexts.add_user_message(chat_id, speaker, text)
+            return
+
+    request = None
+    try:
+        # Merge a burst of messages into one turn; only the last handler continues
+        text = await debouncer.submit(debounce_key, text, DEBOUNCE_SECONDS)
+        if text is None:
+            return
+
+        request = requests_registry.start(debounce_key, REQUEST_DEADLINE_SECONDS)
 
-    conversations[user_id].append({"role": "user", "content": text})
+        if is_group:
+            # The whole group context is sent, but depth is judged by the bot's own exchanges only
+            turn = {"role": "user", "content": f"{speaker}: {text}"}
+            history = group_contexts.get_history(chat_id) + [turn]
+            tier = classifier.classify(text, group_contexts.get_exchanges(chat_id))
+            memories = None
+        else:
+            turn = {"role": "user", "content": text}
+            history = list(conversations[user_id]) + [turn]
+            tier = None
+            memories = long_term_memory.search(user_id, text)
 
-    await bot.send_chat_action(message.chat.id, action="typing")
+        await bot.send_chat_action(chat_id, action="typing")
 
-    response = await get_ai_response(conversations[user_id], user_id)
+        response = await get_ai_response(history, user_id, request, memories, tier=tier)
+
+        # Discard the result if the request was cleared or superseded meanwhile
+        request.check_cancelled()
+    except (asyncio.CancelledError, RequestCancelled) as e:
+        reason = getattr(e, "reason", None) or (request and request.cancelled_reason) or "superseded"
+        if request:
+            requests_registry.finish(request, reason)
+            request = None
+        logger.info(f"Dropped completion for user {user_id}: {reason}")
+        # Superseded and cleared requests drop silently; a timed out one gets the fallback reply
+        if reason != "deadline":
+            return
+        response = None
+    finally:
+        debouncer.complete(debounce_key)
+        if request:
+            requests_registry.finish(request)
 
     if response:
-        conversations[user_id].append({"role": "assistant", "content": response})
+        if not is_group:
+            # Private prompts sent by enough distinct users warm the inline answer cache
+            inline_cache.record_prompt(text, user_id)
+
+        # The turn is only added to the context once it has been answered
+        if is_group:
+            group_contexts.add_user_message(chat_id, speaker, text)
+            group_contexts.add_assistant_message(chat_id, response)
+        else:
+            long_term_memory.add_turn(user_id, text, response)
+            conversations[user_id].append(turn)
+            conversations[user_id].append({"role": "assistant", "content": response})
         await message.answer(response)
     else:
-        fallback = random.choice([
-            "Hey bratha! Brain no dey work good now. Try later, no worries.",
-            "Ah bratha, me get small wahala here. Come back soon!",
-            "You know, me no too sabi tech tings. Try again later, bratha.",
-        ])
-        await message.answer(fallback)
-
-async def get_ai_response(conversation_history, user_id):
+        await message.answer(random.choice(FALLBACK_RESPONSES))
+
+@dp.inline_query()
+async def inline_query_handler(inline_query: InlineQuery):
+    user_id = inline_query.from_user.id
+    query = inline_query.query.strip()
+
+    answers = inline_cache.lookup(query, limit=10)
+
+    # Live completion only when it fits the inline deadline; a newer keystroke supersedes it.
+    # Raw gpt2 fallback text is never offered, as Telegram would cache it as a result.
+    if not answers and query:
+        request = requests_registry.start(("inline", user_id), INLINE_LIVE_DEADLINE)
+        try:
+            response = await get_ai_response(
+                [{"role": "user", "content": query}], user_id, request, tier=TIER_FAST, use_fallback=False
+            )
+        except (asyncio.CancelledError, RequestCancelled) as e:
+            reason = getattr(e, "reason", None) or request.cancelled_reason or "superseded"
+            requests_registry.finish(request, reason)
+            # A superseded query is answered by the newer one; a timed out one still gets an answer
+            if reason != "deadline":
+                return
+        else:
+            requests_registry.finish(request)
+            if response:
+                answers = [(query, response)]
+
+    results = [
+        InlineQueryResultArticle(
+            id=result_id(prompt),
+            title=prompt.capitalize(),
+            description=answer[:100],
+            input_message_content=InputTextMessageContent(message_text=answer[:4096])
+        )
+        for prompt, answer in answers
+    ]
+    await inline_query.answer(results, cache_time=INLINE_CACHE_TIME if results else 10)
+
+async def refresh_inline_cache():
+    async def generate(prompt):
+        request = RequestContext(("inline-refresh", prompt), REQUEST_DEADLINE_SECONDS)
+        # Raw gpt2 fallback text must never be cached as an answer
+        return await get_ai_response(
+            [{"role": "user", "content": prompt}], None, request, tier=TIER_FAST, use_fallback=False
+        )
+
+    while True:
+        try:
+            await inline_cache.refresh(generate)
+        except Exception as e:
+            logger.error(f"Error refreshing inline answer cache: {e}")
+        await asyncio.sleep(INLINE_REFRESH_INTERVAL)
+
+async def get_ai_response(conversation_history, user_id, request=None, memories=None, tier=None, use_fallback=True):
     headers = {
         "Authorization": f"Bearer {OPENROUTER_KEY}",
         "Content-Type": "application/json",
@@ -83,17 +259,38 @@ async def get_ai_response(conversation_history, user_id):
                 "Be ironic and funny sometimes. Don't use emojis much, just talk natural and friendly."
             )
         }
-    ] + list(conversation_history)
+    ]
+    if memories:
+        messages.append({
+            "role": "system",
+            "content": "Things this person told you before that may be relevant:\n\n" + "\n\n".join(memories)
+        })
+    messages += list(conversation_history)
+
+    history = list(conversation_history)
+    last_message = history[-1]["content"] if history else ""
+    if tier is None:
+        # Classify against the previous turns only, as bot.py does
+        tier = classifier.classify(last_message, history[:-1])
+    if tier == TIER_FAST:
+        model, max_tokens = FAST_MODEL, FAST_MAX_TOKENS
+    else:
+        model, max_tokens = FULL_MODEL, FULL_MAX_TOKENS
 
     payload = {
-        "model": "mistralai/mistral-7b-instruct:free",
+        "model": model,
         "messages": messages,
-        "max_tokens": 120,
+        "max_tokens": max_tokens,
         "temperature": 0.7
     }
 
     try:
-        timeout = aiohttp.ClientTimeout(total=30)
+        # The HTTP call is bounded by the request deadline and aborted on cancellation
+        if request:
+            request.check()
+            request.stage = STAGE_UPSTREAM
+        timeout = aiohttp.ClientTimeout(total=request.remaining() if request else 30)
+        started = time.monotonic()
         async with aiohttp.ClientSession(timeout=timeout) as session:
             async with session.post(
                 "https://openrouter.ai/api/v1/chat/completions",
@@ -101,15 +298,28 @@ async def get_ai_response(conversation_history, user_id):
             ) as resp:
                 data = await resp.json()
                 if resp.status == 200 and "choices" in data:
+                    usage = data.get("usage") or {}
+                    tier_stats.record(
+                        tier, time.monotonic() - started,
+                        usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+                    )
+                    logger.info(f"Served {tier} tier for user {user_id}: {tier_stats.summary()[tier]}")
                     return data["choices"][0]["message"]["content"]
                 else:
                     logger.error(f"OpenRouter error {resp.status}: {data}")
-                    return await fallback_huggingface_response(conversation_history)
+                    return await fallback_huggingface_response(conversation_history, request) if use_fallback else None
+    except RequestCancelled:
+        raise
+    except asyncio.TimeoutError:
+        if request and request.expired:
+            raise RequestCancelled("deadline")
+        logger.error("Timeout during AI response")
+        return await fallback_huggingface_response(conversation_history, request) if use_fallback else None
     except Exception as e:
         logger.error(f"Exception during AI response: {e}")
-        return await fallback_huggingface_response(conversation_history)
+        return await fallback_huggingface_response(conversation_history, request) if use_fallback else None
 
-async def fallback_huggingface_response(conversation_history):
+async def fallback_huggingface_response(conversation_history, request=None):
     prompt = conversation_history[-1]["content"] if conversation_history else "Hello"
     hf_url = "https://api-inference.huggingface.co/models/gpt2"
 
@@ -117,8 +327,13 @@ async def fallback_huggingface_response(conversation_history):
         "Accept": "application/json",
     }
 
+    # The fallback call is bounded by the same request deadline
+    if request:
+        request.check()
+    timeout = aiohttp.ClientTimeout(total=request.remaining() if request else 30)
+
     try:
-        async with aiohttp.ClientSession() as session:
+        async with aiohttp.ClientSession(timeout=timeout) as session:
             async with session.post(
                 hf_url,
                 headers=headers,
@@ -130,6 +345,11 @@ async def fallback_huggingface_response(conversation_history):
                 else:
                     logger.error(f"HuggingFace fallback error {resp.status}: {data}")
                     return None
+    except asyncio.TimeoutError:
+        if request and request.expired:
+            raise RequestCancelled("deadline")
+        logger.error("Timeout in fallback HuggingFace")
+        return None
     except Exception as e:
         logger.error(f"Exception in fallback HuggingFace: {e}")
         return None
@@ -138,6 +358,7 @@ async def main():
     logger.info("🚀 Bot starting...")
     me = await bot.get_me()
     logger.info(f"Running as @{me.username}")
+    refresh_task = asyncio.create_task(refresh_inline_cache())
     await dp.start_polling(bot, skip_updates=True)
 
 if __name__ == "__main__":
@@ -0,0 +1,200 @@
+"""
+Per-user token and cost accounting with daily quotas
+"""
+import asyncio
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def _empty_counters() -> Dict[str, int]:
+    return {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "requests": 0}
+
+
+class UsageTracker:
+    """Aggregates completion usage per user and model and flushes it to local storage in batches"""
+
+    def __init__(self, config: Config):
+        self.config = config
+        self.storage_file = config.usage_storage_file
+
+        self._lock = threading.Lock()
+        # Serializes the read-modify-write of the storage file
+        self._flush_lock = threading.Lock()
+        self._flush_task: Optional[asyncio.Future] = None
+        self._day = date.today().isoformat()
+
+        # Today's totals per user and per (user, model), used for quota checks and reports
+        self._daily_totals: Dict[int, int] = defaultdict(int)
+        self._daily_by_model: Dict[Tuple[int, str], Dict[str, int]] = defaultdict(_empty_counters)
+
+        # Usage recorded since the last flush, keyed by (day, user, model)
+        self._pending: Dict[Tuple[str, int, str], Dict[str, int]] = defaultdict(_empty_counters)
+        self._pending_records = 0
+        self._last_flush = time.monotonic()
+
+        self._load_today()
+        atexit.register(self.flush)
+
+    def _load_today(self):
+        """Load today's totals from storage so quotas survive restarts"""
+        try:
+            data = self._read_storage()
+        except Exception as e:
+            logger.error(f"Failed to read usage stats from {self.storage_file}: {e}")
+            return
+        for user_id, models in data.get(self._day, {}).items():
+            for model, counters in models.items():
+                key = (int(user_id), model)
+                for name, value in counters.items():
+                    self._daily_by_model[key][name] += value
+                self._daily_totals[int(user_id)] += counters.get("total_tokens", 0)
+
+    def _roll_day(self):
+        """Reset today's totals when the date changes (caller holds the lock)"""
+        today = date.today().isoformat()
+        if today != self._day:
+            self._day = today
+            self._daily_totals.clear()
+            self._daily_by_model.clear()
+
+    def check_quota(self, user_id: int) -> bool:
+        """Check if user still has tokens left in today's quota"""
+        quota = self.config.settings.daily_token_quota
+        if quota <= 0 or self.config.is_admin(user_id):
+            return True
+
+        with self._lock:
+            self._roll_day()
+            return self._daily_totals.get(user_id, 0) < quota
+
+    def get_daily_usage(self, user_id: int) -> int:
+        """Get tokens used by a user today"""
+        with self._lock:
+            self._roll_day()
+            return self._daily_totals.get(user_id, 0)
+
+    def record(self, user_id: int, model: str, prompt_tokens: int, completion_tokens: int):
+        """
+        Record token usage of a single completion
+
+        Args:
+            user_id: Telegram user ID the completion was made for
+            model: Model that served the completion
+            prompt_tokens: Prompt tokens reported by the API
+            completion_tokens: Completion tokens reported by the API
+        """
+        total_tokens = prompt_tokens + completion_tokens
+
+        with self._lock:
+            self._roll_day()
+            for counters in (self._daily_by_model[(user_id, model)], self._pending[(self._day, user_id, model)]):
+                counters["prompt_tokens"] += prompt_tokens
+                counters["completion_tokens"] += completion_tokens
+                counters["total_tokens"] += total_tokens
+                counters["requests"] += 1
+            self._daily_totals[user_id] += total_tokens
+            self._pending_records += 1
+
+            should_flush = (
+                self._pending_records >= self.config.usage_flush_batch_size
+                or time.monotonic() - self._last_flush >= self.config.usage_flush_interval
+            )
+
+        if should_flush:
+            self._schedule_flush()
+
+    def _schedule_flush(self):
+        """Flush in a worker thread when called from the event loop, so file I/O never blocks it"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush()
+            return
+
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = loop.run_in_executor(None, self.flush)
+
+    def top_consumers(self, limit: int = 10) -> List[Tuple[int, int, Dict[str, int]]]:
+        """
+        Get today's top token consumers
+
+        Returns:
+            List of (user_id, total_tokens, tokens per model) sorted by total tokens
+        """
+        with self._lock:
+            self._roll_day()
+            ranked = sorted(self._daily_totals.items(), key=lambda item: item[1], reverse=True)[:limit]
+            result = []
+            for user_id, total in ranked:
+                per_model = {
+                    model: counters["total_tokens"]
+                    for (uid, model), counters in self._daily_by_model.items()
+                    if uid == user_id
+                }
+                result.append((user_id, total, per_model))
+            return result
+
+    def flush(self):
+        """Write pending usage to local storage"""
+        with self._flush_lock:
+            self._flush()
+
+    def _flush(self):
+        with self._lock:
+            if not self._pending:
+                return
+            pending = self._pending
+            self._pending = defaultdict(_empty_counters)
+            self._pending_records = 0
+            self._last_flush = time.monotonic()
+
+        try:
+            # A read error aborts the flush, so stored history is never overwritten
+            data = self._read_storage()
+            for (day, user_id, model), counters in pending.items():
+                stored = data.setdefault(day, {}).setdefault(str(user_id), {}).setdefault(model, _empty_counters())
+                for name, value in counters.items():
+                    stored[name] = stored.get(name, 0) + value
+
+            # Drop days outside the retention window
+            oldest = (date.today() - timedelta(days=self.config.usage_retention_days)).isoformat()
+            data = {day: users for day, users in data.items() if day >= oldest}
+
+            tmp_file = f"{self.storage_file}.tmp"
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_file, self.storage_file)
+            logger.debug(f"Flushed {len(pending)} usage records to {self.storage_file}")
+        except Exception as e:
+            logger.error(f"Failed to flush usage stats: {e}")
+            # Put the records back so they are retried on the next flush
+            with self._lock:
+                for key, counters in pending.items():
+                    for name, value in counters.items():
+                        self._pending[key][name] += value
+
+    def _read_storage(self) -> dict:
+        """
+        Read usage storage file
+
+        Raises:
+            OSError, ValueError: If the file exists but cannot be read or parsed
+        """
+        if not os.path.exists(self.storage_file):
+            return {}
+        with open(self.storage_file, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if not isinstance(data, dict):
+            raise ValueError("usage stats file must contain a JSON object")
+        return data